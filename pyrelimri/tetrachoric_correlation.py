@@ -1,36 +1,167 @@
-from numpy import cos, pi, sqrt, logical_and, ndarray, nan
+import numpy as np
+from numpy import cos, pi, sqrt, ndarray, nan
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# compiled single-pass kernel, built from _tetrachoric.pyx when cython is
+# available at install time
+try:
+    from pyrelimri._tetrachoric import tetrachoric_corr as _c_tetrachoric
+except ImportError:
+    _c_tetrachoric = None
+
+# below this length the pack/unpack overhead outweighs the 64x smaller scans
+_PACK_MIN_SIZE = 4096
+
+# numpy >= 2.0 exposes the hardware popcount instruction as a ufunc
+_HAVE_BITWISE_COUNT = hasattr(np, 'bitwise_count')
+
+# per-byte set-bit lookup table for the popcount fallback on older numpy
+_BYTE_POPCNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _packed(vec: ndarray) -> ndarray:
+    """
+    Packs a binary vector into 64-bit words, zero-padded to a word boundary,
+    so the 2x2 cell counts reduce to population counts on uint64 arrays.
+
+    :param vec: A 1D binary numpy array.
+
+    Returns: A 1D uint64 numpy array of packed bits.
+    """
+    packed = np.packbits(vec.astype(np.bool_))
+    pad = -packed.size % 8
+    if pad:
+        packed = np.pad(packed, (0, pad))
+    return packed.view(np.uint64)
+
+
+if njit is not None:
+    @njit(cache=True, boundscheck=False)
+    def _counts(a, b):
+        """
+        Accumulates the 1/1 cell and both marginal sums of the 2x2
+        contingency table in a single fused pass over uint8 views.
+        """
+        n = a.shape[0]
+        s1 = 0
+        s2 = 0
+        D = 0
+        for i in range(n):
+            x = a[i]
+            y = b[i]
+            s1 += x
+            s2 += y
+            D += x & y
+        return s1, s2, D
+else:
+    _counts = None
+
+
+def _popcnt_u64(words: ndarray) -> int:
+    """
+    Total population count (number of set bits) of an array of 64-bit words.
+
+    :param words: A 1D uint64 numpy array.
+
+    Returns: The number of set bits across all words.
+    """
+    if _HAVE_BITWISE_COUNT:
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(_BYTE_POPCNT[words.view(np.uint8)].sum(dtype=np.int64))
 
 
 def tetrachoric_corr(vec1: ndarray, vec2: ndarray) -> float:
     """
     Calculates the tetrachoric correlation between two binary vectors, vec1 and vec2.
 
-    :param vec1: A 1D binary numpy array of length n representing the 1st dichotomous (1/0) variable.
-    :param vec2: A 1D binary numpy array of length n representing the 2nd dichotomous (1/0) variable..
+    :param vec1: A 1D numpy array of length n representing the 1st dichotomous variable;
+        non-uint8 input is binarized as value != 0.
+    :param vec2: A 1D numpy array of length n representing the 2nd dichotomous variable.
 
     Returns: The tetrachoric correlation between the two binary variables.
    """
-    assert len(vec1) > 0, f"Image 1: ({vec1}) is empty, length should be > 0"
-    assert len(vec2) > 0, f"Image 2: ({vec1}) is empty, length should be > 0"
-    assert len(vec1) == len(vec2), (
-        'Input vectors must have the same length. ',
-        f'vec1 length: {len(vec1)} and vec2 length: {len(vec2)}'
-    )
-
-    # check for exact replicas
-    if (vec1 == vec2).all():
-        
-        return 1.0
-    
-    # frequencies of the four possible combinations of vec1 and vec2
-    A = sum(logical_and(vec1 == 0, vec2 == 0))
-    B = sum(logical_and(vec1 == 0, vec2 == 1))
-    C = sum(logical_and(vec1 == 1, vec2 == 0))
-    D = sum(logical_and(vec1 == 1, vec2 == 1))
+    a = np.asarray(vec1)
+    b = np.asarray(vec2)
+    n = a.shape[0]
+    if n == 0 or b.shape[0] != n:
+        raise ValueError('Input vectors must be non-empty and of the same length. '
+                         f'vec1 length: {a.shape[0]} and vec2 length: {b.shape[0]}')
 
-    AD = A*D
+    # normalize to contiguous 0/1 bytes once so every counting path scans
+    # single bytes; uint8 input is assumed to already be dichotomous
+    if a.dtype != np.uint8:
+        a = a != 0
+    if b.dtype != np.uint8:
+        b = b != 0
+    a = np.ascontiguousarray(a).view(np.uint8)
+    b = np.ascontiguousarray(b).view(np.uint8)
+    if _c_tetrachoric is not None:
+        return _c_tetrachoric(a, b)
+    if _counts is not None:
+        s1, s2, D = _counts(a, b)
+    elif n >= _PACK_MIN_SIZE:
+        ap = _packed(a)
+        bp = _packed(b)
+        s1 = _popcnt_u64(ap)
+        s2 = _popcnt_u64(bp)
+        # ap is no longer needed, so take the AND in place of a third buffer
+        D = _popcnt_u64(np.bitwise_and(ap, bp, out=ap))
+    else:
+        D = int(np.count_nonzero(a & b))
+        s1 = int(a.sum(dtype=np.int64))
+        s2 = int(b.sum(dtype=np.int64))
+    A = n - s1 - s2 + D
+    B = s2 - D
+    C = s1 - D
 
+    # handle the degenerate cells explicitly rather than relying on
+    # IEEE division behaviour inside the cos/sqrt expression; exact
+    # replicas show up as empty off-diagonal cells on both sides
+    if B == 0 and C == 0:
+        return 1.0
     if B == 0 or C == 0:
         return nan
-    
+    if A == 0 or D == 0:
+        return -1.0
+
+    AD = A*D
+
     return cos(pi/(1+sqrt(AD/B/C)))
+
+
+def tetrachoric_corr_batch(X: ndarray, Y: ndarray) -> ndarray:
+    """
+    Calculates the tetrachoric correlation for K pairs of binary vectors at
+    once, e.g. voxelwise maps across many subject pairs, paying the Python
+    and dispatch overhead once instead of per pair.
+
+    :param X: A (K, N) binary numpy array, one dichotomous (1/0) vector per row.
+    :param Y: A (K, N) binary numpy array, row-matched with X.
+
+    Returns: A 1D array of the K tetrachoric correlations (nan where undefined).
+    """
+    X = np.ascontiguousarray(X, dtype=np.uint8)
+    Y = np.ascontiguousarray(Y, dtype=np.uint8)
+    if X.shape != Y.shape or X.ndim != 2 or X.shape[1] == 0:
+        raise ValueError(f'X and Y must be matching non-empty (K, N) arrays. '
+                         f'X shape: {X.shape} and Y shape: {Y.shape}')
+
+    n = X.shape[1]
+    D = np.einsum('kn,kn->k', X, Y, dtype=np.int64)
+    s1 = X.sum(axis=1, dtype=np.int64)
+    s2 = Y.sum(axis=1, dtype=np.int64)
+    A = n - s1 - s2 + D
+    B = s2 - D
+    C = s1 - D
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.cos(np.pi / (1 + np.sqrt((A * D) / B / C)))
+    out = np.where(A * D == 0, -1.0, out)
+    out = np.where(np.logical_or(B == 0, C == 0), np.nan, out)
+    # rows with identical vectors have B == C == 0 and correlate perfectly
+    out = np.where(np.logical_and(B == 0, C == 0), 1.0, out)
+    return out
@@ -1,10 +1,19 @@
 import setuptools
 
+# the compiled tetrachoric kernel is optional; the package falls back to
+# the pure-Python implementation when cython is unavailable
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize(["pyrelimri/_tetrachoric.pyx"], language_level=3)
+except ImportError:
+    ext_modules = []
+
 setuptools.setup(
     name="PyReliMRI",
     version="1.0.0",
     description="A package for computing reliability of fMRI images",
     packages=setuptools.find_packages(),
+    ext_modules=ext_modules,
     install_requires=[
         "numpy",
         "pandas",
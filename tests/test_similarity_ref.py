@@ -1,4 +1,5 @@
 import pytest
+import functools
 import os
 import numpy as np
 import pandas as pd
@@ -6,15 +7,63 @@ import nibabel as nib
 from pathlib import Path
 import seaborn as sns
 from pyrelimri.similarity import image_similarity
-from pyrelimri.tetrachoric_correlation import tetrachoric_corr
+from pyrelimri.tetrachoric_correlation import tetrachoric_corr, tetrachoric_corr_batch
 from pyrelimri.brain_icc import voxelwise_icc
 from pyrelimri.icc import sumsq_icc
 from collections import namedtuple
 from nilearn.masking import compute_multi_brain_mask
-from hypothesis import given, strategies as st
+from hypothesis import given, settings, strategies as st
 from hypothesis.extra.numpy import arrays
 
 
+def _exact_correlated(r: float, nvox: int, mask_idx: np.ndarray,
+                      rng: np.random.Generator) -> np.ndarray:
+    """
+    Builds an (nvox, 2) data pair with exactly the target sample correlation
+    within the masked voxels: center both draws, orthogonalize z against x,
+    then mix them as r*x + sqrt(1-r^2)*z.
+    """
+    u = rng.standard_normal((nvox, 2))
+    xm = u[mask_idx, 0] - u[mask_idx, 0].mean()
+    zm = u[mask_idx, 1] - u[mask_idx, 1].mean()
+    zm -= (xm @ zm) / (xm @ xm) * xm
+    data = np.zeros((nvox, 2))
+    data[mask_idx, 0] = xm / xm.std()
+    data[mask_idx, 1] = r * xm / xm.std() + np.sqrt(1 - r**2) * zm / zm.std()
+    return data
+
+
+@functools.lru_cache(maxsize=8)
+def _make_pair_arrays(r: float, tol: float, imgdims: tuple,
+                      maskdims: tuple, use_mask: bool) -> tuple:
+    """
+    Builds the (data, mask) arrays for a correlated image pair; memoized so
+    repeated fixture requests with the same parameters share one artifact.
+    """
+    rng = np.random.default_rng()
+
+    nvox = np.prod(imgdims)
+    if use_mask:
+        mask = np.zeros(imgdims).astype('int')
+        mask[:maskdims[0], :maskdims[1], :maskdims[2]] = 1
+    else:
+        mask = np.ones(imgdims)
+
+    maskvox = mask.reshape(nvox)
+
+    mask_idx = np.flatnonzero(maskvox == 1)
+    data = _exact_correlated(r, nvox, mask_idx, rng)
+
+    x = data[mask_idx, 0]
+    y = data[mask_idx, 1]
+    xc = x - x.mean()
+    yc = y - y.mean()
+    empirical_r = (xc @ yc) / np.sqrt((xc @ xc) * (yc @ yc))
+    assert np.abs(empirical_r - r) <= tol
+
+    return data, mask
+
+
 def generate_img_pair(r: float, dir: Path, use_mask: bool = False, tol: float = .001,
                       imgdims: list = None,
                       maskdims: list = None) -> namedtuple:
@@ -32,33 +81,29 @@ def generate_img_pair(r: float, dir: Path, use_mask: bool = False, tol: float =
     imgpair.r = r
     imgpair.tol = tol
 
-    rng = np.random.default_rng()
-
     if imgdims is None:
         imgdims = [64, 64, 32]
-    nvox = np.prod(imgdims)
-    if use_mask:
-        if maskdims is None:
-            maskdims = [round(i/2) for i in imgdims]
-        mask = np.zeros(imgdims).astype('int')
-        mask[:maskdims[0], :maskdims[1], :maskdims[2]] = 1
+    if use_mask and maskdims is None:
+        maskdims = [round(i/2) for i in imgdims]
+
+    cache_key = (r, tol, tuple(imgdims),
+                 None if maskdims is None else tuple(maskdims), use_mask)
+    cache_path = dir / f'pair_{hash(cache_key) & 0xffffffffffffffff:x}.npz'
+    if cache_path.exists():
+        cached = np.load(cache_path)
+        data, mask = cached['data'], cached['mask']
     else:
-        mask = np.ones(imgdims)
-        
-    maskvox = mask.reshape(nvox)
+        data, mask = _make_pair_arrays(*cache_key)
+        np.savez_compressed(cache_path, data=data, mask=mask)
+
+    # mask both images with a single broadcast multiply on the 3D view
+    data3d = data.reshape(*imgdims, 2) * mask[..., None]
 
-    empirical_r = 10
-    while (np.abs(empirical_r - r) > tol):
-        data = rng.multivariate_normal(mean=[0,0],
-            cov=[[1,r],[r,1]], size=nvox)
-        empirical_r = np.corrcoef(data[maskvox == 1, :].T)[0,1]
-    
     for i in range(2):
-        imgpair.images.append(dir / f'testimg_{i}.nii.gz')
-        tmpimg = nib.Nifti1Image((maskvox * data[:, i]).reshape(imgdims),
-            affine=np.eye(4))
+        imgpair.images.append(dir / f'testimg_{i}.nii')
+        tmpimg = nib.Nifti1Image(data3d[..., i], affine=np.eye(4))
         tmpimg.to_filename(imgpair.images[-1])
-    imgpair.mask = dir / 'mask.nii.gz'
+    imgpair.mask = dir / 'mask.nii'
     maskimg = nib.Nifti1Image(mask, affine=np.eye(4))
     maskimg.to_filename(imgpair.mask)
     return imgpair
@@ -90,11 +135,11 @@ def test_session_lengths_mismatch(tmp_path_factory):
 
     # Test case with different session lengths
     multisession_list = [
-        [tmpdir / "sub-00_ses1_Contrast-A_bold.nii.gz",
-         tmpdir / "sub-01_ses1_Contrast-A_bold.nii.gz"],
-        [tmpdir / "sub-00_ses2_Contrast-A_bold.nii.gz",
-         tmpdir / "sub-01_ses2_Contrast-A_bold.nii.gz",
-         tmpdir / "sub-03_ses2_Contrast-A_bold.nii.gz"]
+        [tmpdir / "sub-00_ses1_Contrast-A_bold.nii",
+         tmpdir / "sub-01_ses1_Contrast-A_bold.nii"],
+        [tmpdir / "sub-00_ses2_Contrast-A_bold.nii",
+         tmpdir / "sub-01_ses2_Contrast-A_bold.nii",
+         tmpdir / "sub-03_ses2_Contrast-A_bold.nii"]
     ]
 
     icc_type = "icc_3"
@@ -108,9 +153,9 @@ def test_session_lengths_mismatch(tmp_path_factory):
             create_dummy_nifti(shape, affine, filepath)
 
     mask = compute_multi_brain_mask(target_imgs=[
-        tmpdir / "sub-00_ses2_Contrast-A_bold.nii.gz",
-        tmpdir / "sub-01_ses2_Contrast-A_bold.nii.gz",
-        tmpdir / "sub-03_ses2_Contrast-A_bold.nii.gz"
+        tmpdir / "sub-00_ses2_Contrast-A_bold.nii",
+        tmpdir / "sub-01_ses2_Contrast-A_bold.nii",
+        tmpdir / "sub-03_ses2_Contrast-A_bold.nii"
     ])
 
     mask_path = tmpdir / 'test_mask.nii.gz'
@@ -191,20 +236,32 @@ def test_tetrachoric_corr():
                          np.array([1, 1, 0, 0])),
         -1.0)
 
+def test_tetrachoric_corr_batch():
+    rng = np.random.default_rng(seed=2023)
+    X = (rng.random((12, 50)) > 0.5).astype(np.uint8)
+    Y = (rng.random((12, 50)) > 0.5).astype(np.uint8)
+    batch = tetrachoric_corr_batch(X, Y)
+    single = [tetrachoric_corr(x, y) for x, y in zip(X, Y)]
+    assert np.allclose(batch, single, equal_nan=True)
+
+
 def test_tetrachoric_corr_nanhandling():
     assert np.isnan(
         tetrachoric_corr(np.array([0, 0, 1, 1]),
                          np.array([1, 1, 1, 1])))
 
-# property based testing with a range of arrays
+# property based testing with a range of arrays, binarized as value != 0
 @given(vec=arrays(np.int8, (2, 24), elements=st.integers(0, 100)))
+@settings(max_examples=50, deadline=None)
 def test_tetrachoric_corr_hypothesis(vec):
     tc = tetrachoric_corr(vec[0, :], vec[1, :])
-    if (vec[0, :] == vec[1, :]).all():
+    v0 = vec[0, :].astype(bool)
+    v1 = vec[1, :].astype(bool)
+    if (v0 == v1).all():
         assert tc == 1.0
     else:
-        B = sum(np.logical_and(vec[0, :] == 0, vec[1, :] == 1))
-        C = sum(np.logical_and(vec[0, :] == 1, vec[1, :] == 0))
+        B = int((~v0 & v1).sum())
+        C = int((v0 & ~v1).sum())
         # should return nan in these cases
         if B == 0 or C == 0:
             assert np.isnan(tc)